@@ -1,24 +1,39 @@
-import qrcode
+import segno
+import numpy as np
 from PIL import Image
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.utils import ImageReader
+import io
 import os
-import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import orjson
 from datetime import datetime
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-import pickle
 
 # Google Drive API Setup
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
+# Files up to this size are sent in one request instead of a resumable session
+SINGLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+# Drive service built on first use and shared by later calls
+drive_service = None
 
 
 def get_drive_service():
     """Authenticate and return Google Drive service"""
+    global drive_service
+    if drive_service is not None:
+        return drive_service
+
+    # Google client libraries are only needed for the upload step
+    import pickle
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+    from googleapiclient.discovery import build
+
     creds = None
 
     # Token file stores user's access and refresh tokens
@@ -39,12 +54,15 @@ def get_drive_service():
         with open('token.pickle', 'wb') as token:
             pickle.dump(creds, token)
 
-    return build('drive', 'v3', credentials=creds)
+    drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    return drive_service
 
 
 def upload_to_drive(filename, filepath, folder_id=None):
     """Upload file to Google Drive and return shareable link"""
     try:
+        from googleapiclient.http import MediaFileUpload
+
         service = get_drive_service()
 
         file_metadata = {
@@ -55,12 +73,15 @@ def upload_to_drive(filename, filepath, folder_id=None):
         if folder_id:
             file_metadata['parents'] = [folder_id]
 
-        media = MediaFileUpload(filepath, mimetype='application/json')
+        if os.path.getsize(filepath) <= SINGLE_UPLOAD_MAX_BYTES:
+            media = MediaFileUpload(filepath, mimetype='application/json', chunksize=-1, resumable=False)
+        else:
+            media = MediaFileUpload(filepath, mimetype='application/json', resumable=True)
 
         file = service.files().create(
             body=file_metadata,
             media_body=media,
-            fields='id, webViewLink'
+            fields='id'
         ).execute()
 
         # Make file publicly accessible (read-only)
@@ -83,19 +104,19 @@ def upload_to_drive(filename, filepath, folder_id=None):
         return None, None
 
 
+def matrix_to_image(matrix, box_size, border):
+    """Render a QR module matrix (1 = dark) to a greyscale PIL image"""
+    modules = np.pad(np.asarray(matrix, dtype=np.uint8), border)
+    pixels = np.kron(modules, np.ones((box_size, box_size), dtype=np.uint8))
+    return Image.fromarray((1 - pixels) * 255)
+
+
 def generate_link_qr_code(download_link, output_filename="gdrive_qrcode.png"):
     """Generate QR code for Google Drive download link"""
     try:
-        qr = qrcode.QRCode(
-            version=4,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(download_link)
-        qr.make(fit=True)
+        qr = segno.make_qr(download_link, error='h', boost_error=False)
         
-        qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+        qr_img = matrix_to_image(qr.matrix, box_size=10, border=4)
         
         # Add some text below the QR code
         from PIL import ImageDraw, ImageFont
@@ -103,7 +124,7 @@ def generate_link_qr_code(download_link, output_filename="gdrive_qrcode.png"):
         # Create a larger image to accommodate text
         padding = 50
         new_height = qr_img.size[1] + padding
-        new_img = Image.new('RGB', (qr_img.size[0], new_height), 'white')
+        new_img = Image.new('L', (qr_img.size[0], new_height), 'white')
         new_img.paste(qr_img, (0, 0))
         
         draw = ImageDraw.Draw(new_img)
@@ -122,7 +143,7 @@ def generate_link_qr_code(download_link, output_filename="gdrive_qrcode.png"):
         
         draw.text((text_x, text_y), text, fill="black", font=font)
         
-        new_img.save(output_filename)
+        new_img.save(output_filename, 'PNG', optimize=True)
         print(f"✅ QR code for download link saved as: {output_filename}")
         
         return output_filename
@@ -154,12 +175,17 @@ products = [
     },
 ]
 
+# Product numbers for every item, parallel to products and shared by the JSON export and the PDF
+product_codes = [
+    [f"{product['prefix']}-{i:03d}" for i in range(1, product["count"] + 1)]
+    for product in products
+]
+
+# Individual QR PNGs are only written here when SAVE_PNGS is set
 output_dir = "qr_images"
-os.makedirs(output_dir, exist_ok=True)
 
 # ------------------ PDF SETUP ------------------
 pdf_filename = "product_qrcodes.pdf"
-c = canvas.Canvas(pdf_filename, pagesize=A4)
 page_width, page_height = A4
 
 cols = 10
@@ -170,150 +196,207 @@ spacing_y = 24 * mm
 start_x = 12 * mm
 start_y = page_height - 15 * mm - qr_size_mm * mm
 
+# (x, y) of every QR slot on a page, filled row by row
+grid_x, grid_y = np.meshgrid(start_x + np.arange(cols) * spacing_x, start_y - np.arange(rows) * spacing_y)
+slot_x = grid_x.ravel().tolist()
+slot_y = grid_y.ravel().tolist()
 
-def generate_qr_image(data, filename):
-    """Generate QR code image"""
-    qr = qrcode.QRCode(
-        version=2,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=3,
-        border=2,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
 
-    path = os.path.join(output_dir, f"{filename}.png")
-    qr_img.save(path)
-    return path
+# ImageReaders keyed by QR payload, so identical payloads are encoded once
+qr_image_cache = {}
 
 
-def generate_inventory_json():
-    """Generate JSON file for mobile app import"""
-    inventory_data = []
+def qr_payload(product, product_no):
+    """Build the pipe-delimited QR payload for a single product item"""
+    return f"{product['name']}|{product['price']}|{product['mfd']}|{product['exp']}|{product_no}"
 
-    for product in products:
-        for i in range(1, product["count"] + 1):
-            product_no = f"{product['prefix']}-{i:03d}"
-            price_clean = float(product['price'].replace('Rs. ', '').strip())
-
-            inventory_item = {
-                "productCode": product_no,
-                "name": product["name"],
-                "price": price_clean,
-                "wholesalePrice": price_clean * 0.8,
-                "quantity": 1,
-                "lowStockThreshold": 10,
-                "category": product["category"],
-                "manufactureDate": product["mfd"],
-                "expiryDate": product["exp"],
-                "createdAt": datetime.now().isoformat()
-            }
-            inventory_data.append(inventory_item)
 
-    # Save JSON file locally
-    json_path = "inventory_import.json"
-    with open(json_path, "w", encoding='utf-8') as f:
-        json.dump(inventory_data, f, indent=2, ensure_ascii=False)
+def render_qr_png(data):
+    """Render QR code to PNG bytes (runs in a worker process)"""
+    qr = segno.make_qr(data, error='m', boost_error=False)
 
-    print(f"✅ JSON created: {json_path} with {len(inventory_data)} products")
-    return json_path, inventory_data
+    buf = io.BytesIO()
+    # Greyscale rather than 1-bit: reportlab embeds 'L' as DeviceGray but
+    # expands '1' images to RGB. QR images compress well even at level 1.
+    matrix_to_image(qr.matrix, box_size=3, border=2).save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
 
 
-# ------------------ MAIN GENERATION ------------------
-print("🚀 Starting QR Code Generation with Google Drive Upload...")
-print("=" * 50)
+def generate_qr_images(items):
+    """Render QR codes for a list of (product_no, payload) pairs in parallel and return ImageReaders keyed by payload"""
+    pending = [data for data in dict.fromkeys(data for _, data in items) if data not in qr_image_cache]
 
-# Generate inventory JSON
-json_path, inventory_data = generate_inventory_json()
+    pngs = {}
+    if pending:
+        with ProcessPoolExecutor() as executor:
+            pngs = dict(zip(pending, executor.map(render_qr_png, pending, chunksize=8)))
 
-# Generate QR codes and PDF
-total_qr_count = 0
-for product_index, product in enumerate(products):
-    print(f"📦 Generating QR codes for: {product['name']}")
+    for data, png in pngs.items():
+        qr_image_cache[data] = ImageReader(io.BytesIO(png))
 
-    if product_index > 0:
-        c.showPage()
+    if os.environ.get("SAVE_PNGS"):
+        os.makedirs(output_dir, exist_ok=True)
+        for product_no, data in items:
+            if data in pngs:
+                with open(os.path.join(output_dir, f"{product_no}.png"), "wb") as f:
+                    f.write(pngs[data])
 
-    count = 0
-    for i in range(1, product["count"] + 1):
-        product_no = f"{product['prefix']}-{i:03d}"
-        data = f"{product['name']}|{product['price']}|{product['mfd']}|{product['exp']}|{product_no}"
+    return qr_image_cache
 
-        image_filename = generate_qr_image(data, product_no)
 
-        col = count % cols
-        row = (count // cols) % rows
-        x = start_x + col * spacing_x
-        y = start_y - row * spacing_y
+def draw_labels(c, positions, display_name, name_dx, price_text, price_dx):
+    """Draw all name labels, then all price labels, for one page of QR codes"""
+    c.setFont("Helvetica", 6)
+    for x, y in positions:
+        c.drawString(x + name_dx, y - 3 * mm, display_name)
 
-        c.drawImage(image_filename, x, y, qr_size_mm * mm, qr_size_mm * mm)
+    c.setFont("Helvetica", 5)
+    for x, y in positions:
+        c.drawString(x + price_dx, y - 7 * mm, price_text)
 
-        text_y = y - 3 * mm
-        c.setFont("Helvetica", 6)
-        display_name = product['name'][:15] + "…" if len(product['name']) > 16 else product['name']
 
-        text_width = c.stringWidth(display_name, "Helvetica", 6)
-        text_x = x + (qr_size_mm * mm - text_width) / 2
-        c.drawString(text_x, text_y, display_name)
+def draw_product_qr_codes(c, product, items, qr_readers):
+    """Lay out one product's QR codes and labels, starting new pages as the grid fills"""
+    # Labels depend only on the product, so measure them once
+    display_name = product['name'][:15] + "…" if len(product['name']) > 16 else product['name']
+    name_dx = (qr_size_mm * mm - pdfmetrics.stringWidth(display_name, "Helvetica", 6)) / 2
 
-        price_text = f"Price: {product['price']}"
-        price_width = c.stringWidth(price_text, "Helvetica", 5)
-        price_x = x + (qr_size_mm * mm - price_width) / 2
-        c.setFont("Helvetica", 5)
-        c.drawString(price_x, text_y - 4 * mm, price_text)
+    price_text = f"Price: {product['price']}"
+    price_dx = (qr_size_mm * mm - pdfmetrics.stringWidth(price_text, "Helvetica", 5)) / 2
 
-        count += 1
-        total_qr_count += 1
+    # Bind c.drawImage and the loop's constants once, outside the loop
+    draw_image = c.drawImage
+    qr_size = qr_size_mm * mm
+    page_slots = cols * rows
 
-        if count % (cols * rows) == 0 and count < product["count"]:
+    count = 0
+    page_positions = []
+    for _, data in items:
+        slot = count % page_slots
+        x, y = slot_x[slot], slot_y[slot]
+
+        # Reused readers map to one image XObject; reportlab keys them by content
+        draw_image(qr_readers[data], x, y, qr_size, qr_size)
+        page_positions.append((x, y))
+
+        count += 1
+        if count % page_slots == 0 and count < product["count"]:
+            draw_labels(c, page_positions, display_name, name_dx, price_text, price_dx)
+            page_positions = []
             c.showPage()
             count = 0
 
-    print(f"   ✅ Generated {product['count']} QR codes")
+    if page_positions:
+        draw_labels(c, page_positions, display_name, name_dx, price_text, price_dx)
+
+
+def generate_inventory_json():
+    """Generate JSON file for mobile app import"""
+    inventory_data = []
+    created_at = datetime.now().isoformat()
+
+    for product, codes in zip(products, product_codes):
+        price_clean = float(product['price'].replace('Rs. ', '').strip())
+
+        # Every field except productCode is shared by all items of a product
+        base_item = {
+            "name": product["name"],
+            "price": price_clean,
+            "wholesalePrice": price_clean * 0.8,
+            "quantity": 1,
+            "lowStockThreshold": 10,
+            "category": product["category"],
+            "manufactureDate": product["mfd"],
+            "expiryDate": product["exp"],
+            "createdAt": created_at
+        }
+        inventory_data.extend(
+            {"productCode": product_no, **base_item}
+            for product_no in codes
+        )
+
+    # Save JSON file locally
+    json_path = "inventory_import.json"
+    with open(json_path, "wb") as f:
+        f.write(orjson.dumps(inventory_data, option=orjson.OPT_INDENT_2))
+
+    print(f"✅ JSON created: {json_path} with {len(inventory_data)} products")
+    return json_path, inventory_data
+
+
+# ------------------ MAIN GENERATION ------------------
+if __name__ == "__main__":
+    print("🚀 Starting QR Code Generation with Google Drive Upload...")
+    print("=" * 50)
+
+    # Generate inventory JSON
+    json_path, inventory_data = generate_inventory_json()
+
+    # Render all QR codes up front in parallel, then lay them out in order
+    # (product_no, payload) pairs per product, parallel to products
+    qr_items = [
+        [(product_no, qr_payload(product, product_no)) for product_no in codes]
+        for product, codes in zip(products, product_codes)
+    ]
+    qr_readers = generate_qr_images([item for items in qr_items for item in items])
+
+    # Generate PDF (page streams always zlib-compressed, whatever rl_config says)
+    c = canvas.Canvas(pdf_filename, pagesize=A4, pageCompression=1)
+    for product_index, (product, items) in enumerate(zip(products, qr_items)):
+        print(f"📦 Generating QR codes for: {product['name']}")
+
+        if product_index > 0:
+            c.showPage()
+
+        draw_product_qr_codes(c, product, items, qr_readers)
+
+        print(f"   ✅ Generated {product['count']} QR codes")
 
-c.save()
-print(f"✅ PDF created: {pdf_filename}")
+    c.save()
+    print(f"✅ PDF created: {pdf_filename}")
 
-# Upload to Google Drive
-print("\n📤 Uploading to Google Drive...")
-file_id, download_link = upload_to_drive(
-    filename=f"inventory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-    filepath=json_path
-)
+    # Upload to Google Drive
+    print("\n📤 Uploading to Google Drive...")
+    file_id, download_link = upload_to_drive(
+        filename=f"inventory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+        filepath=json_path
+    )
 
-if download_link:
-    # Generate QR code for the download link (4th output)
-    print("\n🔳 Generating QR code for download link...")
-    qr_filename = generate_link_qr_code(download_link)
+    if download_link:
+        # Generate QR code for the download link (4th output)
+        print("\n🔳 Generating QR code for download link...")
+        qr_filename = generate_link_qr_code(download_link)
     
-    if qr_filename:
-        print(f"✅ QR code image saved as: {qr_filename}")
+        if qr_filename:
+            print(f"✅ QR code image saved as: {qr_filename}")
         
-        # Display the QR code if possible
-        try:
-            img = Image.open(qr_filename)
-            img.show()
-            print("📱 QR code image opened for preview!")
-        except:
-            print("💡 QR code image saved. Open it manually to view.")
+            # Open an external viewer only when asked to (QR_PREVIEW=1) in a terminal
+            if os.environ.get("QR_PREVIEW") and sys.stdout.isatty():
+                try:
+                    with Image.open(qr_filename) as img:
+                        img.show()
+                    print("📱 QR code image opened for preview!")
+                except:
+                    print("💡 QR code image saved. Open it manually to view.")
+            else:
+                print("💡 QR code image saved. Open it manually to view.")
     
-    # Save the link to a text file for easy access
-    with open("gdrive_link.txt", "w") as f:
-        f.write(f"Google Drive Link:\n{download_link}\n\n")
-        f.write(f"File ID: {file_id}\n")
-        if qr_filename:
-            f.write(f"QR Code Image: {qr_filename}\n")
-
-    print("\n" + "=" * 50)
-    print("📋 SETUP COMPLETE!")
-    print("=" * 50)
-    print(f"📱 Use this link in your mobile app:")
-    print(f"   {download_link}")
-    print(f"\n🔳 QR Code for the link saved as: {qr_filename}")
-    print(f"\n💡 Copy this link and add it to your mobile app's")
-    print(f"   QR Import screen for direct download!")
-    print(f"💡 Or scan the QR code from: {qr_filename}")
-else:
-    print("\n⚠️ Google Drive upload failed. Using manual method.")
-    print("📋 Copy content from: inventory_import.json")
+        # Save the link to a text file for easy access
+        with open("gdrive_link.txt", "w") as f:
+            f.write(f"Google Drive Link:\n{download_link}\n\n")
+            f.write(f"File ID: {file_id}\n")
+            if qr_filename:
+                f.write(f"QR Code Image: {qr_filename}\n")
+
+        print("\n" + "=" * 50)
+        print("📋 SETUP COMPLETE!")
+        print("=" * 50)
+        print(f"📱 Use this link in your mobile app:")
+        print(f"   {download_link}")
+        print(f"\n🔳 QR Code for the link saved as: {qr_filename}")
+        print(f"\n💡 Copy this link and add it to your mobile app's")
+        print(f"   QR Import screen for direct download!")
+        print(f"💡 Or scan the QR code from: {qr_filename}")
+    else:
+        print("\n⚠️ Google Drive upload failed. Using manual method.")
+        print("📋 Copy content from: inventory_import.json")